@@ -1,6 +1,7 @@
+import functools
+import numpy as np
 import pandas as pd
-from rapidfuzz import process, fuzz
-from typing import Tuple, List
+from typing import Dict, Set, Tuple, List
 
 # Expanded canonical country list
 CANONICAL_COUNTRIES = [
@@ -23,108 +24,161 @@ CANONICAL_CITIES = [
 ]
 GENDERS = ['Male', 'Female', 'Other']
 MARITAL_STATUSES = ['Single', 'Married', 'Divorced', 'Widowed']
+# Hash sets for O(1) membership checks
+_CANONICAL_COUNTRIES_SET = frozenset(CANONICAL_COUNTRIES)
+_CANONICAL_CITIES_SET = frozenset(CANONICAL_CITIES)
+_GENDERS_SET = frozenset(GENDERS)
+_MARITAL_STATUSES_SET = frozenset(MARITAL_STATUSES)
 
-def correct_issues(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+def _sort_tokens(val: str) -> str:
+    # Same tokenization token_sort_ratio applies internally, done once up front
+    return ' '.join(sorted(val.split()))
+
+# Canonical lists pre-tokenized once at import for fuzzy scoring
+_CANONICAL_COUNTRIES_PP = [_sort_tokens(c) for c in CANONICAL_COUNTRIES]
+_CANONICAL_CITIES_PP = [_sort_tokens(c) for c in CANONICAL_CITIES]
+
+@functools.lru_cache(maxsize=None)
+def _rapidfuzz():
+    # Imported on first fuzzy match, so frames without country/city never load rapidfuzz
+    from rapidfuzz import process, fuzz
+    return process, fuzz
+
+# Fuzzy-match resolutions keyed by cleaned value, kept across correct_issues calls
+FUZZY_CACHE_MAXSIZE = 100_000
+_COUNTRY_CACHE: Dict[str, str] = {}
+_CITY_CACHE: Dict[str, str] = {}
+
+def _fuzzy_standardize(series: pd.Series, canonical: List[str], canonical_set: frozenset, canonical_pp: List[str], threshold: int, cache: Dict[str, str]) -> pd.Series:
+    """
+    Maps each value to its closest canonical entry (or 'Unknown').
+    Fuzzy scoring runs once per unique value not already in cache, via a single cdist call.
+    """
+    cleaned = series.astype(str).str.strip().str.title()
+    uniq = cleaned.unique()
+    misses = [val for val in uniq if val not in cache]
+    if len(cache) + len(misses) > FUZZY_CACHE_MAXSIZE:
+        cache.clear()
+        misses = list(uniq)
+    if misses:
+        process, fuzz = _rapidfuzz()
+        misses_pp = [_sort_tokens(val) for val in misses]
+        scores = process.cdist(misses_pp, canonical_pp, scorer=fuzz.ratio, processor=None, workers=-1)
+        best = scores.argmax(axis=1)
+        best_score = scores.max(axis=1)
+        for val, b, score in zip(misses, best, best_score):
+            if not val or val == 'Unknown':
+                cache[val] = 'Unknown'
+            elif val in canonical_set:
+                cache[val] = val
+            else:
+                cache[val] = canonical[b] if score > threshold else 'Unknown'
+    mapping = {val: cache[val] for val in uniq}
+    return cleaned.map(mapping).where(series.notna(), 'Unknown').fillna('Unknown')
+
+def _to_objects(series: pd.Series) -> np.ndarray:
+    # pd.NA (nullable dtypes) has no truth value, so compare and log it as NaN
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        return series.to_numpy(dtype=object, na_value=np.nan)
+    return series.to_numpy(dtype=object)
+
+def _diff(before: pd.Series, after: pd.Series) -> List[Tuple[int, object, object]]:
+    """
+    Returns (position, old, new) for every row whose value changed.
+    """
+    old = _to_objects(before)
+    new = _to_objects(after)
+    changed = old != new
+    return list(zip(np.flatnonzero(changed).tolist(), old[changed].tolist(), new[changed].tolist()))
+
+def correct_issues(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], Set[str]]:
     """
     Applies corrections to the DataFrame for all columns.
     Returns:
         df: Cleaned DataFrame
         logs: List of correction descriptions
+        modified_cols: Columns in which at least one value was changed
     """
     logs = []
     column_changes = {}
     # Standardize name columns (title case)
     for col in ['first_name', 'last_name', 'full_name']:
         if col in df.columns:
-            before = df[col].copy()
+            before = df[col]
             df[col] = df[col].astype(str).str.title().str.strip()
             df[col] = df[col].replace(['Nan', 'nan', '', None], 'Unknown')
-            column_changes[col] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df[col])) if old != new]
+            column_changes[col] = _diff(before, df[col])
             if column_changes[col]:
                 logs.append(f" Standardized {col} | {[(idx, old, new) for idx, old, new in column_changes[col]]}")
 
-    # Remove duplicates (all columns)
+    # Remove duplicates (all columns except the derived issues labels). Compared on the values
+    # themselves: hash_pandas_object stringifies object columns, so 1 and '1' would collide
     before = len(df)
-    df = df.drop_duplicates(keep='first').copy()
+    df = df[~df.drop(columns=['issues'], errors='ignore').duplicated(keep='first')].copy()
     after = len(df)
     if before != after:
         logs.append(f" Removed {before - after} duplicate rows.")
 
     # Normalize country names (fuzzy match, only if not canonical)
     if 'country' in df.columns:
-        def match_country(val):
-            val_clean = str(val).strip().title()
-            if pd.isnull(val) or not val_clean or val_clean == 'Unknown':
-                return 'Unknown'
-            if val_clean in CANONICAL_COUNTRIES:
-                return val_clean
-            match, score, _ = process.extractOne(val_clean, CANONICAL_COUNTRIES, scorer=fuzz.token_sort_ratio)
-            return match if score > 70 else 'Unknown'
-        before = df['country'].copy()
-        df['country'] = df['country'].apply(match_country)
-        column_changes['country'] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df['country'])) if old != new]
+        before = df['country']
+        df['country'] = _fuzzy_standardize(df['country'], CANONICAL_COUNTRIES, _CANONICAL_COUNTRIES_SET, _CANONICAL_COUNTRIES_PP, 70, _COUNTRY_CACHE)
+        column_changes['country'] = _diff(before, df['country'])
         if column_changes['country']:
             logs.append(f" Standardized country using fuzzy matching | {[(idx, old, new) for idx, old, new in column_changes['country']]}")
 
     # Set negative/zero/implausible ages to median positive age
     if 'age' in df.columns:
         median_age = df[df['age'].apply(lambda x: isinstance(x, (int, float)) and 0 < x < 120)]['age'].median()
-        before = df['age'].copy()
+        before = df['age']
         df['age'] = df['age'].apply(lambda x: median_age if pd.isnull(x) or not isinstance(x, (int, float)) or x <= 0 or x > 120 else x)
-        column_changes['age'] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df['age'])) if old != new]
+        column_changes['age'] = _diff(before, df['age'])
         if column_changes['age']:
             logs.append(f" Standardized age | {[(idx, old, new) for idx, old, new in column_changes['age']]}")
 
     # Set negative loyalty points to 0
     if 'loyalty_points' in df.columns:
-        before = df['loyalty_points'].copy()
+        before = df['loyalty_points']
         df['loyalty_points'] = df['loyalty_points'].apply(lambda x: 0 if pd.isnull(x) or not isinstance(x, (int, float)) or x < 0 else x)
-        column_changes['loyalty_points'] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df['loyalty_points'])) if old != new]
+        column_changes['loyalty_points'] = _diff(before, df['loyalty_points'])
         if column_changes['loyalty_points']:
             logs.append(f" Standardized loyalty_points | {[(idx, old, new) for idx, old, new in column_changes['loyalty_points']]}")
 
     # Standardize gender
     if 'gender' in df.columns:
-        before = df['gender'].copy()
-        df['gender'] = df['gender'].apply(lambda x: x if x in GENDERS else 'Other')
-        column_changes['gender'] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df['gender'])) if old != new]
+        before = df['gender']
+        df['gender'] = df['gender'].apply(lambda x: x if x in _GENDERS_SET else 'Other')
+        column_changes['gender'] = _diff(before, df['gender'])
         if column_changes['gender']:
             logs.append(f" Standardized gender | {[(idx, old, new) for idx, old, new in column_changes['gender']]}")
 
     # Standardize marital status
     if 'marital_status' in df.columns:
-        before = df['marital_status'].copy()
-        df['marital_status'] = df['marital_status'].apply(lambda x: x if x in MARITAL_STATUSES else 'Single')
-        column_changes['marital_status'] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df['marital_status'])) if old != new]
+        before = df['marital_status']
+        df['marital_status'] = df['marital_status'].apply(lambda x: x if x in _MARITAL_STATUSES_SET else 'Single')
+        column_changes['marital_status'] = _diff(before, df['marital_status'])
         if column_changes['marital_status']:
             logs.append(f" Standardized marital_status | {[(idx, old, new) for idx, old, new in column_changes['marital_status']]}")
 
     # Standardize phone (keep only digits and format)
     if 'phone' in df.columns:
-        before = df['phone'].copy()
-        df['phone'] = df['phone'].astype(str).str.replace(r'[^\d]', '', regex=True).str.pad(8, fillchar='0')
-        df['phone'] = df['phone'].apply(lambda x: f"{x[-8:-4]}-{x[-4:]}" if len(x) >= 8 else '0000-0000')
-        column_changes['phone'] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df['phone'])) if old != new]
+        before = df['phone']
+        digits = df['phone'].astype(str).str.replace(r'[^\d]', '', regex=True).str.pad(8, fillchar='0').str[-8:]
+        df['phone'] = digits.str[:4] + '-' + digits.str[4:]
+        column_changes['phone'] = _diff(before, df['phone'])
         if column_changes['phone']:
             logs.append(f" Standardized phone | {[(idx, old, new) for idx, old, new in column_changes['phone']]}")
 
     # Fuzzy match and standardize city names (only if not canonical)
     if 'city' in df.columns:
-        def match_city(val):
-            val_clean = str(val).strip().title()
-            if pd.isnull(val) or not val_clean or val_clean == 'Unknown':
-                return 'Unknown'
-            if val_clean in CANONICAL_CITIES:
-                return val_clean
-            match, score, _ = process.extractOne(val_clean, CANONICAL_CITIES, scorer=fuzz.token_sort_ratio)
-            return match if score > 40 else 'Unknown'
-        before = df['city'].copy()
-        df['city'] = df['city'].apply(match_city)
-        column_changes['city'] = [(idx, old, new) for idx, (old, new) in enumerate(zip(before, df['city'])) if old != new]
+        before = df['city']
+        df['city'] = _fuzzy_standardize(df['city'], CANONICAL_CITIES, _CANONICAL_CITIES_SET, _CANONICAL_CITIES_PP, 40, _CITY_CACHE)
+        column_changes['city'] = _diff(before, df['city'])
         if column_changes['city']:
             logs.append(f" Standardized city using fuzzy matching | {[(idx, old, new) for idx, old, new in column_changes['city']]}")
 
     # Remove the issues column if present 
     if 'issues' in df.columns:
         df = df.drop(columns=['issues'])
-    return df, logs
+    modified_cols = {col for col, changes in column_changes.items() if changes}
+    return df, logs, modified_cols
@@ -1,8 +1,14 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from typing import Tuple, List
+from typing import Iterable, Optional, Set, Tuple, List
 
 EMAIL_REGEX = r"^[\w\.-]+@[\w\.-]+\.\w+$"
 PHONE_REGEX = r"^\d{3,4}-\d{4}$"
+_EMAIL_RE = re.compile(EMAIL_REGEX)
+_PHONE_RE = re.compile(PHONE_REGEX)
 GENDERS = ['Male', 'Female', 'Other']
 MARITAL_STATUSES = ['Single', 'Married', 'Divorced', 'Widowed']
 
@@ -19,78 +25,118 @@ CANONICAL_COUNTRIES = [
     'Uzbekistan', 'Kazakhstan', 'Azerbaijan', 'Georgia', 'Armenia', 'Mongolia', 'Cambodia', 'Laos', 'Myanmar', 'Brunei', 'Timor-Leste'
 ]
 
-def detect_issues(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+# Each check returns a boolean mask of offending rows for one column
+def _invalid_email(df: pd.DataFrame, col: str):
+    email = df[col].astype(str)
+    return ~email.str.match(_EMAIL_RE) | df[col].isnull() | (email.str.strip() == '')
+
+def _invalid_phone(df: pd.DataFrame, col: str):
+    return ~df[col].astype(str).str.match(_PHONE_RE)
+
+def _invalid_gender(df: pd.DataFrame, col: str):
+    return ~df[col].isin(GENDERS)
+
+def _invalid_marital_status(df: pd.DataFrame, col: str):
+    return ~df[col].isin(MARITAL_STATUSES)
+
+# The age and loyalty checks receive the already-coerced numeric columns (see NUMERIC_COLUMNS)
+def _invalid_age(df: pd.DataFrame, col: str):
+    return df[col].isna() | (df[col] <= 0) | (df[col] > 120)
+
+def _invalid_loyalty_points(df: pd.DataFrame, col: str):
+    return df[col].isna() | (df[col] < 0)
+
+def _non_canonical_country(df: pd.DataFrame, col: str):
+    # Category codes are -1 for any value outside the canonical list
+    return pd.Categorical(df[col], categories=CANONICAL_COUNTRIES).codes == -1
+
+def _duplicate_rows(df: pd.DataFrame, col: str):
+    # Same key as correction's dedupe, so exactly the rows it would drop are flagged
+    return df.drop(columns=['issues'], errors='ignore').duplicated(keep=False)
+
+def _empty_name(df: pd.DataFrame, col: str):
+    return df[col].isnull() | (df[col].astype(str).str.strip() == '') | (df[col].astype(str).str.lower() == 'nan')
+
+# (column, check, issue label, log description) in log order; 'duplicate' spans all columns
+CHECKS = [
+    ('email', _invalid_email, 'Invalid Email', 'missing or malformed emails'),
+    ('phone', _invalid_phone, 'Invalid Phone', 'invalid phone numbers'),
+    ('gender', _invalid_gender, 'Invalid Gender', 'invalid gender'),
+    ('marital_status', _invalid_marital_status, 'Invalid Marital Status', 'invalid marital status'),
+    ('age', _invalid_age, 'Invalid Age', 'missing, negative, or implausible ages'),
+    ('loyalty_points', _invalid_loyalty_points, 'Invalid Loyalty Points', 'invalid loyalty points'),
+    ('country', _non_canonical_country, 'Non-canonical Country', 'non-canonical or misspelled countries'),
+    ('duplicate', _duplicate_rows, 'Duplicate', 'duplicate rows found.'),
+] + [(col, _empty_name, f'Empty {col}', f'empty {col}') for col in ['first_name', 'last_name', 'full_name']]
+
+def _to_nullable_numeric(series: pd.Series) -> pd.Series:
+    """
+    Coerces a column to a nullable numeric dtype (non-numeric values become <NA>).
+    Whole-number columns within the int64 range become Int64, anything else Float64.
+    """
+    values = pd.to_numeric(series, errors='coerce')
+    present = values.dropna()
+    if ((present % 1 == 0) & (present >= -2**63) & (present < 2**63)).all():
+        return values.astype('Int64')
+    return values.astype('Float64')
+
+# Numeric columns stored as nullable dtypes once detection has checked them
+NUMERIC_COLUMNS = {
+    'age': lambda series: pd.to_numeric(series, errors='coerce').astype('Float64'),
+    'loyalty_points': _to_nullable_numeric,
+}
+
+def detect_issues(df: pd.DataFrame, cols: Optional[Iterable[str]] = None) -> Tuple[pd.DataFrame, List[str], Set[str]]:
     """
     Scans the DataFrame for common data issues in all columns.
+    If cols is given, only the checks for those columns run (plus the duplicate
+    check when any column is listed); the rest are assumed clean.
     Returns:
         df: DataFrame with an 'issues' column
         logs: List of issue descriptions
+        flagged_cols: Columns with at least one detected issue
     """
     issues = []
     logs = []
     column_changes = {}
-    # Email
-    if 'email' in df.columns:
-        invalid_email_mask = ~df['email'].astype(str).str.match(EMAIL_REGEX)
-        missing_email_mask = df['email'].isnull() | (df['email'].astype(str).str.strip() == '')
-        email_issues_mask = invalid_email_mask | missing_email_mask
-        issues.append(email_issues_mask.map(lambda x: 'Invalid Email' if x else ''))
-        column_changes['email'] = [(idx, val) for idx, val in df[email_issues_mask].email.items()]
-        logs.append(f" {email_issues_mask.sum()} missing or malformed emails | {[(idx, val) for idx, val in column_changes['email']]}")
-    # Phone
-    if 'phone' in df.columns:
-        invalid_phone_mask = ~df['phone'].astype(str).str.match(PHONE_REGEX)
-        issues.append(invalid_phone_mask.map(lambda x: 'Invalid Phone' if x else ''))
-        column_changes['phone'] = [(idx, val) for idx, val in df[invalid_phone_mask].phone.items()]
-        logs.append(f" {invalid_phone_mask.sum()} invalid phone numbers | {[(idx, val) for idx, val in column_changes['phone']]}")
-    # Gender
-    if 'gender' in df.columns:
-        invalid_gender_mask = ~df['gender'].isin(GENDERS)
-        issues.append(invalid_gender_mask.map(lambda x: 'Invalid Gender' if x else ''))
-        column_changes['gender'] = [(idx, val) for idx, val in df[invalid_gender_mask].gender.items()]
-        logs.append(f" {invalid_gender_mask.sum()} invalid gender | {[(idx, val) for idx, val in column_changes['gender']]}")
-    # Marital Status
-    if 'marital_status' in df.columns:
-        invalid_marital_mask = ~df['marital_status'].isin(MARITAL_STATUSES)
-        issues.append(invalid_marital_mask.map(lambda x: 'Invalid Marital Status' if x else ''))
-        column_changes['marital_status'] = [(idx, val) for idx, val in df[invalid_marital_mask].marital_status.items()]
-        logs.append(f" {invalid_marital_mask.sum()} invalid marital status | {[(idx, val) for idx, val in column_changes['marital_status']]}")
-    # Age
-    if 'age' in df.columns:
-        invalid_age_mask = df['age'].apply(lambda x: pd.isnull(x) or (isinstance(x, (int, float)) and (x <= 0 or x > 120)))
-        issues.append(invalid_age_mask.map(lambda x: 'Invalid Age' if x else ''))
-        column_changes['age'] = [(idx, val) for idx, val in df[invalid_age_mask].age.items()]
-        logs.append(f" {invalid_age_mask.sum()} missing, negative, or implausible ages | {[(idx, val) for idx, val in column_changes['age']]}")
-    # Loyalty Points
-    if 'loyalty_points' in df.columns:
-        invalid_loyalty_mask = df['loyalty_points'].apply(lambda x: pd.isnull(x) or (isinstance(x, (int, float)) and x < 0))
-        issues.append(invalid_loyalty_mask.map(lambda x: 'Invalid Loyalty Points' if x else ''))
-        column_changes['loyalty_points'] = [(idx, val) for idx, val in df[invalid_loyalty_mask].loyalty_points.items()]
-        logs.append(f" {invalid_loyalty_mask.sum()} invalid loyalty points | {[(idx, val) for idx, val in column_changes['loyalty_points']]}")
-    # Country
-    if 'country' in df.columns:
-        non_canonical_mask = ~df['country'].isin(CANONICAL_COUNTRIES)
-        issues.append(non_canonical_mask.map(lambda x: 'Non-canonical Country' if x else ''))
-        column_changes['country'] = [(idx, val) for idx, val in df[non_canonical_mask].country.items()]
-        logs.append(f" {non_canonical_mask.sum()} non-canonical or misspelled countries | {[(idx, val) for idx, val in column_changes['country']]}")
-    # Duplicates
-    duplicate_mask = df.duplicated(keep=False)
-    issues.append(duplicate_mask.map(lambda x: 'Duplicate' if x else ''))
-    column_changes['duplicate'] = [(idx, 'DUPLICATE') for idx in df[duplicate_mask].index]
-    logs.append(f" {duplicate_mask.sum()} duplicate rows found. | {[(idx) for idx, val in column_changes['duplicate']]}")
-    # Empty names
-    for col in ['first_name', 'last_name', 'full_name']:
-        if col in df.columns:
-            empty_name_mask = df[col].isnull() | (df[col].astype(str).str.strip() == '') | (df[col].astype(str).str.lower() == 'nan')
-            issues.append(empty_name_mask.map(lambda x: f'Empty {col}' if x else ''))
-            column_changes[col] = [(idx, val) for idx, val in df[empty_name_mask][col].items()]
-            logs.append(f" {empty_name_mask.sum()} empty {col} | {[(idx, val) for idx, val in column_changes[col]]}")
-    # Combine all issues into a single column
-    def combine_issues(row):
-        return ', '.join([str(issue) for issue in row if issue])
+    cols = None if cols is None else set(cols)
+    def should_check(col):
+        if col == 'duplicate':
+            return cols is None or bool(cols)
+        return col in df.columns and (cols is None or col in cols)
+    active = [check for check in CHECKS if should_check(check[0])]
+    # Coerce each checked numeric column once; its check and the stored column both reuse it
+    typed = {col: to_typed(df[col]) for col, to_typed in NUMERIC_COLUMNS.items() if should_check(col)}
+    numeric = pd.DataFrame(typed, index=df.index)
+    # Checks are independent and spend their time in pandas/NumPy, so run them concurrently
+    futures = []
+    if active:
+        with ThreadPoolExecutor(max_workers=min(len(active), os.cpu_count() or 1)) as executor:
+            futures = [(col, label, description, executor.submit(check, numeric if col in typed else df, col)) for col, check, label, description in active]
+    # Merge in a fixed order so labels and logs don't depend on thread scheduling
+    for col, label, description, future in futures:
+        mask = np.asarray(future.result(), dtype=bool)
+        issues.append(np.where(mask, f'{label}, ', ''))
+        if col == 'duplicate':
+            column_changes[col] = [(idx, 'DUPLICATE') for idx in df.index[mask]]
+            logs.append(f" {mask.sum()} {description} | {[(idx) for idx, val in column_changes[col]]}")
+        else:
+            flagged = df.loc[mask, col]
+            if isinstance(flagged.dtype, pd.api.extensions.ExtensionDtype):
+                # Log pd.NA from the nullable numeric columns as NaN, like the other columns
+                flagged = pd.Series(flagged.to_numpy(dtype=object, na_value=np.nan), index=flagged.index)
+            column_changes[col] = [(idx, val) for idx, val in flagged.items()]
+            logs.append(f" {mask.sum()} {description} | {[(idx, val) for idx, val in column_changes[col]]}")
+    # Combine all issues into a single column (each label carries its own ', ' separator)
     if issues:
-        issues_df = pd.DataFrame(issues).T
-        df['issues'] = issues_df.apply(combine_issues, axis=1)
-    elif 'issues' in df.columns:
-        df = df.drop(columns=['issues'])
-    return df, logs
+        combined = pd.Series(issues[0], index=df.index, dtype=object).str.cat(issues[1:])
+        df['issues'] = combined.str.rstrip(', ')
+    else:
+        df['issues'] = ''
+    # Store checked numeric columns typed so later passes compare them directly, unless
+    # coercion would drop a non-numeric value the correction log still needs to show
+    for col, values in typed.items():
+        if values.isna().equals(df[col].isna()):
+            df[col] = values
+    flagged_cols = {col for col, changes in column_changes.items() if changes and col in df.columns}
+    return df, logs, flagged_cols
@@ -1,14 +1,110 @@
 import pandas as pd
 import os
-from typing import Tuple, List
+import asyncio
+import hashlib
+import pickle
+import threading
+from pathlib import Path
+from typing import Set, Tuple, List
 from dotenv import load_dotenv
-import google.generativeai as genai  
 import re
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
+# Rows sent to Gemini per prompt; chunks are requested concurrently
+CHUNK_SIZE = 50
+# Upper bound on Gemini requests in flight at once, to stay under the API rate limit
+MAX_CONCURRENT_REQUESTS = 5
+# Gemini responses keyed by prompt hash, persisted so re-runs skip resolved chunks
+CACHE_PATH = Path(__file__).resolve().parent.parent / "logs" / "gemini_cache.pkl"
+# Oldest cached responses are evicted beyond this many entries
+CACHE_MAXSIZE = 1000
+_LLM_CACHE = None
+_MODEL = None
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+genai = None
 
-def enrich_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+def _configure_once():
+    # google.generativeai is slow to import; load and configure it only when a request is actually sent
+    global genai
+    if genai is None:
+        import google.generativeai as _genai
+        load_dotenv()
+        _genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
+        genai = _genai
+    return genai
+
+def _model():
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = _configure_once().GenerativeModel("gemini-2.5-flash")
+    return _MODEL
+
+def _run_async(coro):
+    # The SDK caches its async gRPC client, which stays bound to the first event loop it ran on,
+    # so every caller thread submits to one long-lived loop running in a background thread
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="gemini-event-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+def _load_cache() -> dict:
+    global _LLM_CACHE
+    if _LLM_CACHE is None:
+        try:
+            with open(CACHE_PATH, "rb") as f:
+                _LLM_CACHE = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            _LLM_CACHE = {}
+    return _LLM_CACHE
+
+def _cache_response(cache: dict, key: str, response: str):
+    # Dicts keep insertion order, so re-inserting moves the key to the newest end
+    cache.pop(key, None)
+    cache[key] = response
+    while len(cache) > CACHE_MAXSIZE:
+        cache.pop(next(iter(cache)))
+
+def _save_cache():
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(CACHE_PATH, "wb") as f:
+            pickle.dump(_LLM_CACHE, f)
+    except OSError as e:
+        print("GEMINI CACHE ERROR:", e)
+
+# Placeholder strings (compared stripped and lowercased) that mark a cell as missing
+MISSING_TOKENS = frozenset(['', 'missing', 'unknown', 'nan'])
+# Columns Gemini adds to every row
+ENRICHED_COLUMNS = ['is_loyal_customer', 'customer_persona']
+# Loyalty points at or above this mark a customer as loyal in the rule-based fallback
+LOYALTY_POINTS_THRESHOLD = 1000
+
+def _rule_based_attributes(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds is_loyal_customer and customer_persona to complete rows without calling Gemini.
+    Values already present (e.g. from an earlier enrichment pass) are kept.
+    """
+    rows = rows.copy()
+    if 'loyalty_points' in rows.columns:
+        points = pd.to_numeric(rows['loyalty_points'], errors='coerce').fillna(0)
+    else:
+        points = pd.Series(0, index=rows.index)
+    loyal = points >= LOYALTY_POINTS_THRESHOLD
+    if 'occupation' in rows.columns:
+        occupation = rows['occupation'].astype(str)
+    else:
+        occupation = pd.Series('Customer', index=rows.index)
+    attributes = {
+        'is_loyal_customer': loyal.map({True: 'Yes', False: 'No'}),
+        'customer_persona': occupation + '; ' + loyal.map({True: 'loyal repeat buyer.', False: 'occasional buyer.'}),
+    }
+    for col, values in attributes.items():
+        rows[col] = rows[col].fillna(values) if col in rows.columns else values
+    return rows
+
+def enrich_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str], Set[str]]:
     """
     Enriches the DataFrame by:
     - Filling missing values using Gemini LLM (mocked here)
@@ -16,54 +112,106 @@ def enrich_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
     Returns:
         df: Enriched DataFrame
         logs: List of enrichment descriptions
+        modified_cols: Columns that were added or had any value changed
     """
     logs = []
-    def gemini_generate(prompt_text):
+    modified_cols = set()
+    df = df.reset_index(drop=True)
+    cache = _load_cache()
+    # Responses are only cached once they parse into a usable chunk (see below)
+    async def gemini_generate(prompt_text, cache_key, semaphore):
+        if cache_key in cache:
+            return cache[cache_key]
         try:
             print("GEMINI PROMPT:", prompt_text)  # or use logging
-            model = genai.GenerativeModel("gemini-2.5-flash")
-            response = model.generate_content(prompt_text).text.strip()
+            async with semaphore:
+                response = (await _model().generate_content_async(prompt_text)).text.strip()
             print("GEMINI RESPONSE:", response)  # or use logging
             return response
         except Exception as e:
             print("GEMINI ERROR:", e)
-            return "Unknown"
+            return None
+
+    async def gemini_generate_all(prompts, cache_keys):
+        # Created here so it belongs to the loop that runs the requests
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        return await asyncio.gather(*(gemini_generate(p, k, semaphore) for p, k in zip(prompts, cache_keys)))
     
     # Replace all missing/invalid values with 'MISSING'
-    df_for_gemini = df.copy()
-    for col in df_for_gemini.columns:
-        df_for_gemini[col] = df_for_gemini[col].replace([None, '', 'Unknown', 'NaN', 'nan', pd.NA], 'MISSING')
-        if df_for_gemini[col].dtype == object:
-            df_for_gemini[col] = df_for_gemini[col].apply(lambda x: 'MISSING' if pd.isnull(x) or str(x).strip() == '' else x)
-    # Prepare CSV string for Gemini
-    csv_str = df_for_gemini.to_csv(index=False)
+    # (built straight from stringified columns; every cell ends up as text in the prompt anyway)
+    df_for_gemini = pd.DataFrame({col: df[col].astype(str) for col in df.columns}, index=df.index)
+    missing = df.isna() | df_for_gemini.apply(lambda c: c.str.strip().str.lower().isin(MISSING_TOKENS))
+    df_for_gemini.mask(missing, 'MISSING', inplace=True)
     # Compose prompt with strict CSV formatting instructions
-    prompt = (
+    instructions = (
         "You are a data cleaning and enrichment agent. For the following CSV, fill in every 'MISSING' value in each row with a realistic, plausible value in the same format as the other values in that column. "
         "If you cannot infer a value, generate a random plausible value in the same format as the rest of the column. "
         "Additionally, for each row, generate two new columns: 'is_loyal_customer' (Yes/No, based on profile) and 'customer_persona' (max two lines, concise, describing their likely personality, values, and buying habits). "
         "Return the result as a CSV with the same columns as input plus the two new columns, and no extra text. "
         "IMPORTANT: Enclose every field in double quotes. Do NOT use commas inside any field (use semicolons or periods instead). Do not add extra header or footer text.\n\n"
-        + csv_str
     )
-    response = gemini_generate(prompt)
-    # Remove markdown code block markers if present
-    response = re.sub(r'^```csv\s*|```$', '', response, flags=re.MULTILINE).strip()
-    # Robust CSV parsing: remove any extra lines, ensure quoting
+    # Only rows with a MISSING value go to Gemini, one prompt per chunk, sent concurrently
+    needs_llm = df_for_gemini.drop(columns=['issues'], errors='ignore').eq('MISSING').any(axis=1)
+    dirty_rows = df[needs_llm]
+    starts = list(range(0, len(dirty_rows), CHUNK_SIZE))
+    prompts = [instructions + df_for_gemini[needs_llm].iloc[start:start + CHUNK_SIZE].to_csv(index=False) for start in starts]
+    cache_keys = [hashlib.blake2b(prompt.encode()).hexdigest() for prompt in prompts]
+    responses = _run_async(gemini_generate_all(prompts, cache_keys))
+    # Robust CSV parsing: the C parser skips rows with extra fields in the same pass.
+    # Quotes inside fields are escaped by doubling them (standard CSV), so a backslash is plain text
     from io import StringIO
-    import csv
+    def parse_response(response):
+        # Remove markdown code block markers if present
+        response = re.sub(r'^```csv\s*|```$', '', response, flags=re.MULTILINE).strip()
+        return pd.read_csv(StringIO(response), engine='c', on_bad_lines='skip', quotechar='"')
+    # Chunks that fail keep their original rows so positions stay aligned
+    enriched_chunks = []
+    failed_chunks = 0
+    for start, cache_key, response in zip(starts, cache_keys, responses):
+        original_chunk = dirty_rows.iloc[start:start + CHUNK_SIZE]
+        try:
+            if response is None:
+                raise ValueError("no response from Gemini")
+            enriched_chunk = parse_response(response)
+            if len(enriched_chunk) != len(original_chunk):
+                raise ValueError(f"expected {len(original_chunk)} rows, got {len(enriched_chunk)}")
+            # Short rows are padded with NaN rather than skipped, so check columns and new fields too
+            missing_cols = [col for col in [*original_chunk.columns, *ENRICHED_COLUMNS] if col not in enriched_chunk.columns]
+            if missing_cols:
+                raise ValueError(f"missing columns {missing_cols}")
+            enriched_chunk.index = original_chunk.index
+            truncated = enriched_chunk[ENRICHED_COLUMNS].isna().any(axis=1)
+            if truncated.all():
+                raise ValueError("truncated rows (empty is_loyal_customer/customer_persona)")
+            if truncated.any():
+                # Keep the good rows; truncated ones stay as they were and go to Gemini again next pass
+                logs.append(f"Gemini returned truncated rows {list(original_chunk.index[truncated])}; left them unenriched.")
+                enriched_chunks.append(enriched_chunk[~truncated])
+                enriched_chunks.append(original_chunk[truncated])
+            else:
+                enriched_chunks.append(enriched_chunk)
+                _cache_response(cache, cache_key, response)
+        except Exception as e:
+            logs.append(f"Gemini CSV parse error (rows {start}-{start + len(original_chunk) - 1}): {e}")
+            enriched_chunks.append(original_chunk)
+            failed_chunks += 1
+            # Never keep a bad reply, so the next pass asks Gemini again
+            cache.pop(cache_key, None)
+    _save_cache()
+    # Failed chunks only leave their own rows unenriched; complete rows never depend on Gemini
+    gemini_failed = bool(prompts) and failed_chunks == len(prompts)
+    if gemini_failed:
+        logs.append("Gemini enrichment error: no chunk was enriched")
     try:
-        # Only keep lines with the correct number of columns (header + data)
-        header = response.splitlines()[0]
-        num_fields = len(list(csv.reader([header]))[0])
-        filtered_lines = [line for line in response.splitlines() if len(list(csv.reader([line]))[0]) == num_fields]
-        filtered_csv = '\n'.join(filtered_lines)
-        enriched_df = pd.read_csv(StringIO(filtered_csv), quotechar='"', escapechar='\\')
+        clean_rows = _rule_based_attributes(df[~needs_llm])
+        if not clean_rows.empty:
+            logs.append(f"Added is_loyal_customer and customer_persona to {len(clean_rows)} complete rows without Gemini (rule-based).")
+        enriched_df = pd.concat([clean_rows, *enriched_chunks]).sort_index()
         # Log all changes made by enrichment (compare before/after for missing/MISSING/Unknown)
         column_changes = {}
         for col in df.columns:
             if col in enriched_df.columns:
-                column_changes[col] = [(idx, old, new) for idx, (old, new) in enumerate(zip(df[col], enriched_df[col])) if str(old).strip().lower() in ["", "missing", "unknown", "nan"] and str(new).strip().lower() not in ["", "missing", "unknown", "nan"]]
+                column_changes[col] = [(idx, old, new) for idx, (old, new) in enumerate(zip(df[col], enriched_df[col])) if str(old).strip().lower() in MISSING_TOKENS and str(new).strip().lower() not in MISSING_TOKENS]
                 if column_changes[col]:
                     logs.append(f" Column: {col} | {[(idx, old, new) for idx, old, new in column_changes[col]]}")
         # Log new columns
@@ -71,12 +219,17 @@ def enrich_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
             if col not in df.columns:
                 column_changes[col] = [(idx, val) for idx, val in enumerate(enriched_df[col])]
                 logs.append(f" Column: {col} | {[(idx, val) for idx, val in column_changes[col]]}")
+        modified_cols = {
+            col for col in enriched_df.columns
+            if col != 'issues' and (col not in df.columns or (df[col].astype(str).to_numpy() != enriched_df[col].astype(str).to_numpy()).any())
+        }
         df = enriched_df  
-        logs.append("Enriched all missing values and added is_loyal_customer and customer_persona using Gemini in a single prompt (strict CSV format).")
+        if not gemini_failed:
+            logs.append(f"Enriched all missing values and added is_loyal_customer and customer_persona using Gemini in {len(prompts)} chunked prompt(s) for {len(dirty_rows)} incomplete rows (strict CSV format).")
     except Exception as e:
-        logs.append(f"Gemini CSV parse error: {e}")
+        logs.append(f"Gemini enrichment error: {e}")
             
     # After enrichment, clear the issues column (all should be fixed)
     if 'issues' in df.columns:
         df['issues'] = ''
-    return df, logs
+    return df, logs, modified_cols
@@ -5,15 +5,17 @@ import os
 import traceback
 from agents.detection_agent import detect_issues
 from agents.correction_agent import correct_issues
-from agents.enrichment_agent import enrich_data
+from agents.enrichment_agent import enrich_data, MISSING_TOKENS
 
 def setup_logging(log_path):
-    logging.basicConfig(
-        filename=log_path,
-        format="%(asctime)s — %(levelname)s — %(message)s",
-        level=logging.INFO,
-        filemode='a'
-    )
+    # Attach the file handler once per path so repeated in-process runs don't duplicate lines
+    logger = logging.getLogger()
+    log_path = os.path.abspath(log_path)
+    if not any(isinstance(h, logging.FileHandler) and h.baseFilename == log_path for h in logger.handlers):
+        handler = logging.FileHandler(log_path, mode='a')
+        handler.setFormatter(logging.Formatter("%(asctime)s — %(levelname)s — %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
 
 def needs_correction(df):
     # Correction is needed if any issues are present
@@ -24,69 +26,86 @@ def needs_correction(df):
 
 def needs_enrichment(df):
     # Check for missing values or 'MISSING' or 'Unknown' in any cell (excluding 'issues' column)
+    # Returns on the first matching column; numeric columns can't hold placeholder strings
     for col in df.columns:
         if col == 'issues':
             continue
-        if df[col].isnull().any() or (df[col].astype(str).str.strip().str.lower().isin(['missing', 'unknown', 'nan', ''])).any():
+        s = df[col]
+        if s.isnull().any():
+            return True
+        if not pd.api.types.is_numeric_dtype(s) and s.astype(str).str.strip().str.lower().isin(MISSING_TOKENS).any():
             return True
     return False
 
+def run_pipeline(input_path, output_path, log_path):
+    """
+    Runs detection, correction and enrichment on input_path until no issues remain
+    (or max iterations), writes the cleaned CSV to output_path and logs to log_path.
+    Raises on failure; callers decide how to report it.
+    """
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    setup_logging(log_path)
+    df = pd.read_csv(input_path)
+    logging.info(f"Loaded input CSV: {input_path}")
+    max_iterations = 3
+    iteration = 0
+    # Columns to re-check on the next detection pass (None = all); anything not flagged
+    # and not touched by correction/enrichment since the last pass cannot have new issues
+    check_cols = None
+    while iteration < max_iterations:
+        iteration += 1
+        logging.info(f"--- Pipeline Iteration {iteration} ---")
+        # Detection (always at start of loop)
+        df, detect_logs, flagged_cols = detect_issues(df, cols=check_cols)
+        for entry in detect_logs:
+            logging.info(f"[Detection Agent] {entry}")
+        # Correction if needed
+        if needs_correction(df):
+            logging.info(f"Correction needed, forwarding to Correction Agent.")
+            df, correction_logs, corrected_cols = correct_issues(df)
+            for entry in correction_logs:
+                logging.info(f"[Correction Agent] {entry}")
+            # Enrichment if needed after correction
+            if needs_enrichment(df):
+                logging.info(f"Enrichment needed after correction, forwarding to Enrichment Agent.")
+                df, enrich_logs, enriched_cols = enrich_data(df)
+                for entry in enrich_logs:
+                    logging.info(f"[Enrichment Agent] {entry}")
+                check_cols = flagged_cols | corrected_cols | enriched_cols
+                logging.info(f"Forwarding to Detection Agent for re-check.")
+                if iteration == max_iterations:
+                    df, detect_logs, _ = detect_issues(df, cols=check_cols)
+                    for entry in detect_logs:
+                        logging.info(f"[Detection Agent] {entry}")
+                    if not df['issues'].str.strip().any():
+                        logging.info(f"All issues resolved after {iteration} iterations.")
+                    else:
+                        logging.warning(f"Maximum iterations ({max_iterations}) reached. Some issues may remain.")
+                        remaining_issues = df[df['issues'].str.strip() != '']
+                        if not remaining_issues.empty:
+                            logging.warning(f"Rows with unresolved issues after max iterations:")
+                            for idx, row in remaining_issues.iterrows():
+                                logging.warning(f"Row {idx}: {row['issues']}")
+                        else:
+                            logging.info(f"All issues resolved after {iteration} iterations.")
+            else:
+                logging.info(f"No enrichment needed after correction.")
+                break
+        else:
+            logging.info(f"No correction needed after detection.")
+            break
+        
+    df.to_csv(output_path, index=False)
+    logging.info(f"Saved cleaned CSV: {output_path}")
+    return df
+
 @click.command()
 @click.option('--input', '-i', required=True, help='Path to input CSV file')
 @click.option('--output', '-o', required=True, help='Path to output cleaned CSV file')
 @click.option('--log', '-l', default='logs/agent_logs.txt', help='Path to log file')
 def main(input, output, log):
-    os.makedirs(os.path.dirname(log), exist_ok=True)
-    setup_logging(log)
     try:
-        df = pd.read_csv(input)
-        logging.info(f"Loaded input CSV: {input}")
-        max_iterations = 3
-        iteration = 0
-        while iteration < max_iterations:
-            iteration += 1
-            logging.info(f"--- Pipeline Iteration {iteration} ---")
-            # Detection (always at start of loop)
-            df, detect_logs = detect_issues(df)
-            for entry in detect_logs:
-                logging.info(f"[Detection Agent] {entry}")
-            # Correction if needed
-            if needs_correction(df):
-                logging.info(f"Correction needed, forwarding to Correction Agent.")
-                df, correction_logs = correct_issues(df)
-                for entry in correction_logs:
-                    logging.info(f"[Correction Agent] {entry}")
-                # Enrichment if needed after correction
-                if needs_enrichment(df):
-                    logging.info(f"Enrichment needed after correction, forwarding to Enrichment Agent.")
-                    df, enrich_logs = enrich_data(df)
-                    for entry in enrich_logs:
-                        logging.info(f"[Enrichment Agent] {entry}")
-                    logging.info(f"Forwarding to Detection Agent for re-check.")
-                    if iteration == max_iterations:
-                        df, detect_logs = detect_issues(df)
-                        for entry in detect_logs:
-                            logging.info(f"[Detection Agent] {entry}")
-                        if not df['issues'].str.strip().any():
-                            logging.info(f"All issues resolved after {iteration} iterations.")
-                        else:
-                            logging.warning(f"Maximum iterations ({max_iterations}) reached. Some issues may remain.")
-                            remaining_issues = df[df['issues'].str.strip() != '']
-                            if not remaining_issues.empty:
-                                logging.warning(f"Rows with unresolved issues after max iterations:")
-                                for idx, row in remaining_issues.iterrows():
-                                    logging.warning(f"Row {idx}: {row['issues']}")
-                            else:
-                                logging.info(f"All issues resolved after {iteration} iterations.")
-                else:
-                    logging.info(f"No enrichment needed after correction.")
-                    break
-            else:
-                logging.info(f"No correction needed after detection.")
-                break
-            
-        df.to_csv(output, index=False)
-        logging.info(f"Saved cleaned CSV: {output}")
+        run_pipeline(input, output, log)
         click.echo(f"Pipeline completed. Cleaned data saved to {output}. Logs at {log}.")
     except Exception as e:
         logging.error(f"Pipeline failed: {e}\n{traceback.format_exc()}")
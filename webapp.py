@@ -1,20 +1,27 @@
 import streamlit as st
 import pandas as pd
 import os
-import subprocess
-import sys
+import logging
+import traceback
+import tempfile
+import threading
 from pathlib import Path
+from cli import run_pipeline
+
+# Agents keep module-level state (Gemini cache and event loop, fuzzy-match caches),
+# so concurrent sessions take turns running the pipeline; each run has its own temp files
+_PIPELINE_LOCK = threading.Lock()
 
 def run_cli_pipeline(input_path, output_path, log_path):
-    project_root = Path(__file__).parent.resolve()
-    cli_path = project_root / "cli.py"
-    result = subprocess.run([
-        sys.executable, str(cli_path),
-        '--input', str(input_path),
-        '--output', str(output_path),
-        '--log', str(log_path)
-    ], capture_output=True, text=True, cwd=project_root)
-    return result
+    # Runs the CLI pipeline in-process; returns the error traceback, or None on success
+    try:
+        with _PIPELINE_LOCK:
+            run_pipeline(str(input_path), str(output_path), str(log_path))
+        return None
+    except Exception as e:
+        error = traceback.format_exc()
+        logging.error(f"Pipeline failed: {e}\n{error}")
+        return error
 
 def read_logs_with_fallback(log_path):
     try:
@@ -32,14 +39,14 @@ def main():
         df = pd.read_csv(uploaded_file)
         st.write("### Raw Data", df)
         if st.button("Clean Data"): 
-            with st.spinner("Running data-fixing pipeline (CLI)..."):
+            with st.spinner("Running data-fixing pipeline..."), tempfile.TemporaryDirectory() as run_dir:
                 project_root = Path(__file__).parent.resolve()
-                input_path = project_root / "data/temp_input.csv"
-                output_path = project_root / "data/temp_output.csv"
+                input_path = Path(run_dir) / "input.csv"
+                output_path = Path(run_dir) / "output.csv"
                 log_path = project_root / "logs/agent_logs.txt"
                 df.to_csv(input_path, index=False, encoding="utf-8")
-                result = run_cli_pipeline(input_path, output_path, log_path)
-                if result.returncode == 0 and output_path.exists():
+                error = run_cli_pipeline(input_path, output_path, log_path)
+                if error is None and output_path.exists():
                     cleaned_df = pd.read_csv(output_path)
                     st.success("Data cleaned!")
                     st.write("### Cleaned Data", cleaned_df)
@@ -56,7 +63,7 @@ def main():
                                 st.text(log.strip())
                 else:
                     st.error("Pipeline failed. See details below:")
-                    st.text(result.stderr)
+                    st.text(error)
 
 if __name__ == "__main__":
     main()